@@ -4,8 +4,11 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from database.models import setup_db, RSVP, Invitation
+from database.models import setup_db, RSVP, Invitation, GuestListReport
+from database.instrumentation import init_query_instrumentation
 from auth.auth import AuthError, requires_auth
+from utils.compression import init_compression
+from utils.responses import list_response
 
 import os
 import logging
@@ -34,8 +37,17 @@ LOG.debug("Starting with log level: %s" % LOG_LEVEL)
 def create_app(test_config=None):
 
     app = Flask(__name__)
+    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+    if test_config is not None:
+        app.config.update(test_config)
     setup_db(app)
     CORS(app)
+    init_compression(app)
+    app.config.setdefault('QUERY_BUDGETS', {
+        'update_rsvp': {'queries': 5},
+        'delete_rsvp': {'queries': 4}
+    })
+    init_query_instrumentation(app)
 
     @app.route('/', methods=['GET'])
     def get_index():
@@ -45,16 +57,17 @@ def create_app(test_config=None):
     def get_invitations():
         '''
         GET list of all invitations
+        ?format=compact returns the columnar shape
         '''
-        invitations = Invitation.query.all()
-        return jsonify(success=True, invitations=[i.format() for i in invitations])
+        invitations = Invitation.live().all()
+        return list_response('invitations', [i.format() for i in invitations], Invitation.format_columns)
 
     @app.route('/invitations/<int:id>', methods=['GET'])
     def get_invitation(id):
         '''
         GET an invitation by ID
         '''
-        invitation = Invitation.query.filter(Invitation.id == id).one_or_none()
+        invitation = Invitation.live().filter(Invitation.id == id).one_or_none()
         if invitation:
             return jsonify(success=True, invitations=invitation.format())
         else:
@@ -85,7 +98,7 @@ def create_app(test_config=None):
         PATCH an invitation
         requires patch:invitation auth
         '''
-        invitation = Invitation.query.filter(Invitation.id == id).one_or_none()
+        invitation = Invitation.live().filter(Invitation.id == id).one_or_none()
         try:
             if invitation is None:
                 abort(404)
@@ -106,9 +119,10 @@ def create_app(test_config=None):
     def delete_invitation(payload, id):
         '''
         DELETE an invitation
+        the invitation is soft deleted and archived later with its RSVPs
         requires delete:invitation auth
         '''
-        invitation = Invitation.query.get(id)
+        invitation = Invitation.live().filter(Invitation.id == id).one_or_none()
 
         if invitation is None:
             abort(404)
@@ -125,9 +139,10 @@ def create_app(test_config=None):
         '''
         GET a list of RSVPs to a single invitation
         requires get:invitation-rsvps auth
+        ?format=compact returns the columnar shape with invitation_id hoisted
         '''
-        rsvps = RSVP.query.filter_by(invitation_id=invitation_id).all()
-        return jsonify(success=True, rsvps=[r.format() for r in rsvps])
+        rsvps = RSVP.query.join(Invitation).filter(Invitation.deleted_at.is_(None), RSVP.invitation_id == invitation_id).all()
+        return list_response('rsvps', [r.format() for r in rsvps], RSVP.format_columns, invitation_id=invitation_id)
 
     @app.route('/invitations/<int:invitation_id>/rsvps/<int:rsvp_id>', methods=['GET'])
     @requires_auth('get:invitation-rsvp-details')
@@ -136,7 +151,7 @@ def create_app(test_config=None):
         GET an RSVP to a single invitation
         requires get:rsvp auth
         '''
-        rsvp = RSVP.query.filter(RSVP.invitation_id==invitation_id, RSVP.id==rsvp_id).one_or_none()
+        rsvp = RSVP.query.join(Invitation).filter(Invitation.deleted_at.is_(None), RSVP.invitation_id==invitation_id, RSVP.id==rsvp_id).one_or_none()
         if rsvp:
             if rsvp.jwt_sub != payload['sub']:
                 raise AuthError({
@@ -155,7 +170,7 @@ def create_app(test_config=None):
         POST an RSVP
         requires post:rsvp auth
         '''
-        invitation = Invitation.query.get(invitation_id)
+        invitation = Invitation.live().filter(Invitation.id == invitation_id).one_or_none()
         if invitation is None:
             abort(404)
 
@@ -188,7 +203,7 @@ def create_app(test_config=None):
         PATCH an RSVP
         requires patch:rsvp auth
         '''
-        invitation = Invitation.query.get(invitation_id)
+        invitation = Invitation.live().filter(Invitation.id == invitation_id).one_or_none()
         if invitation is None:
             abort(404)
 
@@ -231,7 +246,7 @@ def create_app(test_config=None):
         DELETE an RSVP
         requires delete:rsvp auth
         '''
-        invitation = Invitation.query.get(invitation_id)
+        invitation = Invitation.live().filter(Invitation.id == invitation_id).one_or_none()
         if invitation is None:
             abort(404)
 
@@ -253,7 +268,18 @@ def create_app(test_config=None):
         except:
             abort(500)
 
-    
+    @app.route('/reports/guest-list', methods=['GET'])
+    @requires_auth('get:invitation-rsvps')
+    def get_guest_list_report(payload):
+        '''
+        GET RSVP counts for every invitation, with totals
+        read from the guest_list_report table, so it doesn't scan RSVPs
+        requires get:invitation-rsvps auth
+        '''
+        reports = GuestListReport.query.order_by(GuestListReport.invitation_id).all()
+        return jsonify(success=True,
+                       totals=GuestListReport.totals(reports),
+                       invitations=[r.format() for r in reports])
 
     @app.errorhandler(422)
     def unprocessable(error):
@@ -5,12 +5,17 @@ from jose import jwt
 from urllib.request import urlopen
 from dotenv import load_dotenv
 import os
+import time
 
 load_dotenv()
 
 AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN') 
 ALGORITHMS = ['RS256']
 API_AUDIENCE = os.getenv('API_AUDIENCE')
+JWKS_TTL = int(os.getenv('JWKS_TTL', 3600))
+JWKS_MIN_REFRESH = 60
+
+_jwks_cache = {'jwks': None, 'fetched_at': 0.0}
 
 '''
 AuthError Exception
@@ -71,37 +76,63 @@ def check_permissions(permission, payload):
         }, 403)
     return True
 
+'''
+get_jwks(refresh) method
+    @INPUTS
+        refresh: fetch the key set even if the cached copy is still fresh,
+            at most once every JWKS_MIN_REFRESH seconds
+
+    it fetches the Auth0 /.well-known/jwks.json key set
+    it caches the key set for JWKS_TTL seconds, so requests don't refetch it
+    return the key set
+'''
+def get_jwks(refresh=False):
+    age = time.time() - _jwks_cache['fetched_at']
+    if _jwks_cache['jwks'] is None or age > JWKS_TTL or (refresh and age > JWKS_MIN_REFRESH):
+        jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+        _jwks_cache['jwks'] = json.loads(jsonurl.read())
+        _jwks_cache['fetched_at'] = time.time()
+    return _jwks_cache['jwks']
+
+'''
+find_rsa_key(jwks, kid) method
+    return the RSA key with the given key id, or an empty dict
+'''
+def find_rsa_key(jwks, kid):
+    for key in jwks['keys']:
+        if key['kid'] == kid:
+            return {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }
+    return {}
+
 '''
 verify_decode_jwt(token) method
     @INPUTS
         token: a json web token (string)
 
     it takes an Auth0 token with key id (kid)
-    it verifies the token using Auth0 /.well-known/jwks.json
+    it verifies the token using the cached Auth0 /.well-known/jwks.json
+        the key set is refetched once if the key id is unknown, in case keys were rotated
     it decodes the payload from the token
     it validates the claims
     return the decoded payload
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = find_rsa_key(get_jwks(), unverified_header['kid'])
+    if not rsa_key:
+        rsa_key = find_rsa_key(get_jwks(refresh=True), unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -0,0 +1,92 @@
+'''
+Compares gunicorn worker configurations on the local machine.
+
+Each configuration is started with gunicorn.conf.py, loaded with concurrent
+GET requests for a fixed time, then stopped. Requests per second and
+latency percentiles are reported for each one.
+
+    DATABASE_URL=... python benchmarks/bench_gunicorn.py [seconds] [clients] [path]
+'''
+import os
+import sys
+import time
+import signal
+import subprocess
+from urllib.request import urlopen
+from urllib.error import URLError
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 8765
+
+CONFIGS = {
+    'defaults (1 sync)': ['gunicorn', '--bind', f'127.0.0.1:{PORT}', 'app:app'],
+    'sync': {'GUNICORN_WORKER_CLASS': 'sync'},
+    'gthread': {'GUNICORN_WORKER_CLASS': 'gthread'},
+    'gevent': {'GUNICORN_WORKER_CLASS': 'gevent'},
+}
+
+
+def start(config):
+    env = dict(os.environ, PORT=str(PORT))
+    if isinstance(config, list):
+        command = config
+    else:
+        env.update(config)
+        command = ['gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{PORT}', 'app:app']
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            urlopen(f'http://127.0.0.1:{PORT}/').read()
+            return server
+        except URLError:
+            if server.poll() is not None:
+                return None
+            time.sleep(0.1)
+    stop(server)
+    return None
+
+
+def stop(server):
+    server.send_signal(signal.SIGTERM)
+    server.wait()
+
+
+def client(url, deadline):
+    latencies = []
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        urlopen(url).read()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(seconds, clients, path):
+    url = f'http://127.0.0.1:{PORT}{path}'
+    print(f"{'config':<20}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, config in CONFIGS.items():
+        server = start(config)
+        if server is None:
+            print(f'{name:<20}{"failed to start":>30}')
+            continue
+        try:
+            deadline = time.perf_counter() + seconds
+            with ThreadPoolExecutor(clients) as pool:
+                results = list(pool.map(lambda _: client(url, deadline), range(clients)))
+        finally:
+            stop(server)
+        latencies = sorted(l for result in results for l in result)
+        print(f'{name:<20}{len(latencies) / seconds:>10.1f}'
+              f'{percentile(latencies, 0.5) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    path = sys.argv[3] if len(sys.argv) > 3 else '/invitations'
+    run(seconds, clients, path)
@@ -0,0 +1,83 @@
+'''
+Compares the list shapes for GET /invitations and GET /invitations/<id>/rsvps
+under the app's own config:
+
+    jsonify   what the endpoints returned before list_response
+    default   list_response
+    compact   list_response with ?format=compact
+
+For each shape it reports the serialized size, the gzip and brotli
+sizes on the wire, and the mean serialization time.
+
+    python benchmarks/bench_responses.py [rows]
+'''
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import jsonify
+from app import create_app
+from database.models import Invitation, RSVP
+from utils.compression import brotli, compress_chunks
+from utils.responses import list_response
+
+
+def make_invitations(n):
+    invitations = []
+    for i in range(n):
+        invitation = Invitation(name=f'Host {i}', email=f'host{i}@example.com',
+                                description='Please join us to celebrate our wedding.')
+        invitation.id = i + 1
+        invitations.append(invitation.format())
+    return invitations
+
+
+def make_rsvps(n):
+    rsvps = []
+    for i in range(n):
+        rsvp = RSVP(invitation_id=1, response='Attending', guest_name=f'Guest {i}',
+                    guest_email=f'guest{i}@example.com', plus_one=bool(i % 2))
+        rsvp.id = i + 1
+        rsvps.append(rsvp.format())
+    return rsvps
+
+
+def wire_size(body, encoding):
+    return sum(len(block) for block in compress_chunks([body], encoding))
+
+
+def bench(app, label, path, key, items, columns, extra):
+    def serialize_jsonify():
+        with app.test_request_context(path):
+            return jsonify(success=True, **{key: items}).get_data()
+
+    def serialize_list(query):
+        def serialize():
+            with app.test_request_context(path + query):
+                return list_response(key, items, columns, **extra).get_data()
+        return serialize
+
+    shapes = {
+        'jsonify': serialize_jsonify,
+        'default': serialize_list(''),
+        'compact': serialize_list('?format=compact'),
+    }
+    print(f'\n{label} ({len(items)} rows)')
+    print(f"{'shape':<10}{'bytes':>12}{'gzip':>12}{'br':>12}{'ms':>10}")
+    for shape, serialize in shapes.items():
+        body = serialize()
+        seconds = min(timeit.repeat(serialize, number=5, repeat=3)) / 5
+        br = wire_size(body, 'br') if brotli is not None else '-'
+        print(f'{shape:<10}{len(body):>12}{wire_size(body, "gzip"):>12}{br:>12}{seconds * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    app = create_app()
+    bench(app, 'GET /invitations', '/invitations', 'invitations',
+          make_invitations(rows), Invitation.format_columns, {})
+    bench(app, 'GET /invitations/1/rsvps', '/invitations/1/rsvps', 'rsvps',
+          make_rsvps(rows), RSVP.format_columns, {'invitation_id': 1})
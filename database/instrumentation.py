@@ -0,0 +1,153 @@
+import json
+import time
+import logging
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LOG = logging.getLogger(__name__)
+
+QUERY_BUDGET_DEFAULT = {'queries': 10, 'ms': 500}
+SLOW_QUERY_MS = 100
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+'''
+QueryBudgetExceeded Exception
+raised at the end of a request that ran more queries, or spent more time
+in the database, than its route allows
+'''
+class QueryBudgetExceeded(Exception):
+    def __init__(self, endpoint, queries, budget):
+        self.endpoint = endpoint
+        self.queries = queries
+        self.budget = budget
+        super().__init__(
+            f"{endpoint} ran {len(queries)} queries in {total_ms(queries):.1f}ms, "
+            f"budget is {budget['queries']} queries in {budget['ms']}ms"
+        )
+
+
+def total_ms(queries):
+    return sum(q['ms'] for q in queries)
+
+
+def parameter_shape(parameters, executemany=False):
+    '''
+      parameter_shape(parameters, executemany)
+          describes bound parameters by type only, so values never reach the logs
+    '''
+    if executemany:
+        return {
+            'executemany': len(parameters),
+            'row': parameter_shape(parameters[0]) if parameters else None
+        }
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def explain(cursor, dialect, statement, parameters):
+    '''
+      explain(cursor, dialect, statement, parameters)
+          returns the query plan for a statement as a list of rows
+          runs on the raw DBAPI connection so it is not recorded itself
+          outside SQLite it runs inside a savepoint, so a failed EXPLAIN
+          doesn't abort the request's transaction
+    '''
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    plan_cursor = cursor.connection.cursor()
+    savepoint = dialect != 'sqlite'
+    try:
+        if savepoint:
+            plan_cursor.execute('SAVEPOINT explain_plan')
+        try:
+            plan_cursor.execute(prefix + statement, parameters)
+            plan = [list(row) for row in plan_cursor.fetchall()]
+        except Exception:
+            if savepoint:
+                plan_cursor.execute('ROLLBACK TO SAVEPOINT explain_plan')
+            raise
+        finally:
+            if savepoint:
+                plan_cursor.execute('RELEASE SAVEPOINT explain_plan')
+        return plan
+    finally:
+        plan_cursor.close()
+
+
+def is_explainable(statement):
+    return statement.lstrip().upper().startswith(EXPLAINABLE)
+
+
+def get_budget(app, endpoint):
+    budget = dict(app.config['QUERY_BUDGET_DEFAULT'])
+    budget.update(app.config['QUERY_BUDGETS'].get(endpoint, {}))
+    return budget
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+    if not has_request_context() or statement.startswith(TRANSACTION_CONTROL):
+        return
+
+    query = {
+        'statement': statement,
+        'ms': ms,
+        'parameters': parameter_shape(parameters, executemany)
+    }
+    g.setdefault('queries', []).append(query)
+
+    if ms >= current_app.config.get('SLOW_QUERY_MS', SLOW_QUERY_MS):
+        entry = dict(query, endpoint=request.endpoint)
+        if not executemany and is_explainable(statement):
+            try:
+                entry['plan'] = explain(cursor, conn.dialect.name, statement, parameters)
+            except Exception as e:
+                entry['plan_error'] = str(e)
+        LOG.warning('slow query %s', json.dumps(entry, default=str))
+
+
+def init_query_instrumentation(app):
+    '''
+      init_query_instrumentation(app)
+          records every statement run while handling a request in g.queries
+          and checks it against the route's budget when the request ends
+
+          QUERY_BUDGET_DEFAULT  {'queries': n, 'ms': t} applied to every route
+          QUERY_BUDGETS         per-endpoint overrides, keyed by view function name
+          QUERY_BUDGET_RAISE    raise QueryBudgetExceeded instead of logging,
+                                defaults to app.testing
+          SLOW_QUERY_MS         statements slower than this are written to the
+                                slow-query log together with their EXPLAIN plan
+    '''
+    app.config.setdefault('QUERY_BUDGET_DEFAULT', QUERY_BUDGET_DEFAULT)
+    app.config.setdefault('QUERY_BUDGETS', {})
+    app.config.setdefault('SLOW_QUERY_MS', SLOW_QUERY_MS)
+
+    if not event.contains(Engine, 'after_cursor_execute', after_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def reset_queries():
+        g.queries = []
+
+    @app.after_request
+    def check_query_budget(response):
+        queries = g.get('queries', [])
+        budget = get_budget(app, request.endpoint)
+        if len(queries) <= budget['queries'] and total_ms(queries) <= budget['ms']:
+            return response
+
+        error = QueryBudgetExceeded(request.endpoint, queries, budget)
+        if app.config.get('QUERY_BUDGET_RAISE', app.testing):
+            raise error
+        LOG.warning('%s %s', error, json.dumps([q['statement'] for q in queries]))
+        return response
+
+    return app
@@ -1,24 +1,43 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import sqlite3
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime, create_engine, func, case, event, select, insert, literal, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import column_property
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-database_path = os.environ['DATABASE_URL']
-if database_path.startswith("postgres://"):
-  database_path = database_path.replace("postgres://", "postgresql://", 1)
+default_database_path = os.environ['DATABASE_URL']
+if default_database_path.startswith("postgres://"):
+  default_database_path = default_database_path.replace("postgres://", "postgresql://", 1)
 
 db = SQLAlchemy()
 
 
-def setup_db(app, database_path=database_path):
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    '''
+      enable_sqlite_foreign_keys()
+          SQLite ignores ON DELETE CASCADE unless foreign keys are switched on per connection
+    '''
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def setup_db(app, database_path=None):
     '''
       setup_db(app)
           binds a flask application and a SQLAlchemy service
+          uses database_path, else SQLALCHEMY_DATABASE_URI from the app config, else DATABASE_URL
     '''
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+    if database_path is not None:
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", default_database_path)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
@@ -46,6 +65,7 @@ class Invitation(db.Model):
           name: Name of the invited guest.
           email: Email address of the invited guest.
           plus_one: Boolean indicating whether the guest is allowed to bring a plus one.
+          deleted_at: When the invitation was soft deleted, None while it is live.
     '''
     __tablename__ = 'invitations'
 
@@ -53,14 +73,34 @@ class Invitation(db.Model):
     name = Column(String(120), nullable=False)
     email = Column(String(120), nullable=False)
     description = Column(String(500), nullable=False)
-    rsvps = db.relationship('RSVP', backref='invitation', lazy=True)
+    deleted_at = Column(DateTime, nullable=True)
+    rsvps = db.relationship('RSVP', backref='invitation', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    report = db.relationship('GuestListReport', uselist=False, cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_invitations_live', id,
+                 postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        db.Index('ix_invitations_deleted_at', deleted_at,
+                 postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+    )
+
+    format_columns = ('id', 'name', 'email', 'description')
 
     def __init__(self, name:str, email:str, description:str) -> None:
         self.name = name
         self.email = email
         self.description = description
 
+    @classmethod
+    def live(cls):
+        '''
+          live()
+              query over invitations that have not been soft deleted
+        '''
+        return cls.query.filter(cls.deleted_at.is_(None))
+
     def insert(self):
+        self.report = GuestListReport(refreshed_at=datetime.utcnow())
         db.session.add(self)
         db.session.commit()
 
@@ -68,6 +108,20 @@ class Invitation(db.Model):
         db.session.commit()
 
     def delete(self):
+        '''
+          delete()
+              soft deletes the invitation, its RSVPs are kept until it is archived
+        '''
+        self.deleted_at = datetime.utcnow()
+        self.report = None
+        db.session.commit()
+
+    def hard_delete(self):
+        '''
+          hard_delete()
+              removes the invitation row, the database cascades to its RSVPs
+              without SQLAlchemy loading them first
+        '''
         db.session.delete(self)
         db.session.commit()
 
@@ -95,11 +149,14 @@ class RSVP(db.Model):
 
     id = Column(Integer, primary_key=True)
     jwt_sub = Column(String(120), nullable=False)
-    response = Column(String(120), nullable=False)
+    # active_history keeps the old values around, so update() can work out the report delta
+    response = column_property(Column(String(120), nullable=False), active_history=True)
     guest_name = Column(String(120), nullable=False)
     guest_email = Column(String(120), unique=True, nullable=False)
-    plus_one = Column(db.Boolean, default=False)
-    invitation_id = Column(Integer, db.ForeignKey('invitations.id'), nullable=False)
+    plus_one = column_property(Column(db.Boolean, default=False), active_history=True)
+    invitation_id = Column(Integer, db.ForeignKey('invitations.id', ondelete='CASCADE'), nullable=False, index=True)
+
+    format_columns = ('id', 'invitation_id', 'response', 'guest_name', 'guest_email', 'plus_one')
 
     def __init__(self, invitation_id:int, response:str, guest_name:str, guest_email:str, jwt_sub:str='', plus_one:bool=False) -> None :
         self.invitation_id = invitation_id
@@ -111,15 +168,47 @@ class RSVP(db.Model):
 
     def insert(self):
         db.session.add(self)
+        GuestListReport.apply(self.invitation_id, self.report_counts())
         db.session.commit()
 
     def update(self):
+        current = self.report_counts()
+        previous = self.report_counts(previous=True)
+        delta = {name: current[name] - previous[name] for name in current}
+        if any(delta.values()):
+            GuestListReport.apply(self.invitation_id, delta)
         db.session.commit()
 
     def delete(self):
+        previous = self.report_counts(previous=True)
         db.session.delete(self)
+        GuestListReport.apply(self.invitation_id, {name: -count for name, count in previous.items()})
         db.session.commit()
 
+    def report_counts(self, previous=False):
+        '''
+          report_counts(previous)
+              what this RSVP adds to its invitation's GuestListReport row
+              previous=True uses the values from before any unsaved changes
+        '''
+        response, plus_one = self.response, self.plus_one
+        if previous:
+            state = inspect(self)
+            history = state.attrs.response.history
+            response = history.deleted[0] if history.deleted else response
+            history = state.attrs.plus_one.history
+            plus_one = history.deleted[0] if history.deleted else plus_one
+
+        attending = response == 'Attending'
+        not_attending = response == 'Not Attending'
+        return {
+            'rsvps': 1,
+            'attending': int(attending),
+            'not_attending': int(not_attending),
+            'pending': int(not attending and not not_attending),
+            'plus_ones': int(attending and bool(plus_one))
+        }
+
     def format(self):
         return {
             'id': self.id,
@@ -129,3 +218,220 @@ class RSVP(db.Model):
             'guest_email': self.guest_email if self.guest_email else None,
             'plus_one':self.plus_one
         }
+
+
+class GuestListReport(db.Model):
+    '''
+      GuestListReport
+      Pre-aggregated RSVP counts for one invitation, read by the guest-list report.
+      Every RSVP write adds its change to the row,
+      and all rows can be rebuilt with `python manage.py refresh_reports`.
+
+        invitation_id (primary key): Foreign key referencing the Invitation model.
+        rsvps: Number of RSVPs to the invitation.
+        attending: Number of "Attending" responses.
+        not_attending: Number of "Not Attending" responses.
+        pending: Number of RSVPs with any other response, e.g. "Undecided".
+        plus_ones: Number of attending guests bringing a plus one.
+        refreshed_at: When the counts were last computed.
+    '''
+    __tablename__ = 'guest_list_report'
+
+    invitation_id = Column(Integer, db.ForeignKey('invitations.id', ondelete='CASCADE'), primary_key=True)
+    rsvps = Column(Integer, nullable=False, default=0)
+    attending = Column(Integer, nullable=False, default=0)
+    not_attending = Column(Integer, nullable=False, default=0)
+    pending = Column(Integer, nullable=False, default=0)
+    plus_ones = Column(Integer, nullable=False, default=0)
+    refreshed_at = Column(DateTime, nullable=False)
+
+    @staticmethod
+    def aggregate():
+        '''
+          aggregate()
+              query computing the report counts per live invitation from the rsvps table
+        '''
+        def count_if(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+        attending = RSVP.response == 'Attending'
+        return db.session.query(
+            Invitation.id,
+            func.count(RSVP.id),
+            count_if(attending),
+            count_if(RSVP.response == 'Not Attending'),
+            count_if(RSVP.response.notin_(['Attending', 'Not Attending'])),
+            count_if(attending & RSVP.plus_one)
+        ).outerjoin(RSVP, RSVP.invitation_id == Invitation.id) \
+         .filter(Invitation.deleted_at.is_(None)).group_by(Invitation.id)
+
+    @classmethod
+    def refresh(cls, invitation_id=None):
+        '''
+          refresh(invitation_id)
+              recomputes the report row of one invitation, or every row when no id is given
+              the changes are added to the current session and committed by the caller
+              a full refresh first locks the table in EXCLUSIVE mode: it waits for
+              in-flight delta writers and holds off new ones until the caller commits,
+              so no delta lands between the aggregate and the rewrite, reads go on
+              a single row is only refreshed by apply(), under the invitation's lock
+              SQLite serializes writers by itself
+        '''
+        if invitation_id is None and db.session.connection().dialect.name != 'sqlite':
+            db.session.execute(text(f'LOCK TABLE {cls.__tablename__} IN EXCLUSIVE MODE'))
+
+        query = cls.aggregate()
+        if invitation_id is not None:
+            query = query.filter(Invitation.id == invitation_id)
+
+        now = datetime.utcnow()
+        reports = [
+            cls(invitation_id=id, rsvps=rsvps, attending=attending, not_attending=not_attending,
+                pending=pending, plus_ones=plus_ones, refreshed_at=now)
+            for id, rsvps, attending, not_attending, pending, plus_ones in query.all()
+        ]
+
+        if invitation_id is None:
+            cls.query.delete()
+            db.session.add_all(reports)
+        else:
+            for report in reports:
+                db.session.merge(report)
+
+    @classmethod
+    def apply(cls, invitation_id, delta):
+        '''
+          apply(invitation_id, delta)
+              adds delta to the counts of the invitation's report row in one UPDATE,
+              so concurrent RSVP writes add up instead of overwriting each other
+              a missing row is rebuilt from the rsvps table while holding a lock
+              on the invitation, so only one writer creates it
+              the changes are made in the current session and committed by the caller
+        '''
+        if cls._add(invitation_id, delta):
+            return
+
+        db.session.query(Invitation.id).filter(Invitation.id == invitation_id) \
+            .with_for_update(key_share=True).one_or_none()
+        if cls._add(invitation_id, delta):
+            return
+        cls.refresh(invitation_id)
+
+    @classmethod
+    def _add(cls, invitation_id, delta):
+        table = cls.__table__
+        values = {name: table.c[name] + count for name, count in delta.items()}
+        result = db.session.execute(
+            table.update()
+            .where(table.c.invitation_id == invitation_id)
+            .values(refreshed_at=datetime.utcnow(), **values)
+        )
+        return result.rowcount
+
+    @staticmethod
+    def totals(reports):
+        '''
+          totals(reports)
+              sums report rows into the organizer-wide overview
+        '''
+        totals = {
+            'invitations': len(reports),
+            'rsvps': sum(r.rsvps for r in reports),
+            'attending': sum(r.attending for r in reports),
+            'not_attending': sum(r.not_attending for r in reports),
+            'pending': sum(r.pending for r in reports),
+            'plus_ones': sum(r.plus_ones for r in reports)
+        }
+        totals['response_rate'] = response_rate(totals['rsvps'], totals['pending'])
+        return totals
+
+    def format(self):
+        return {
+            'invitation_id': self.invitation_id,
+            'rsvps': self.rsvps,
+            'attending': self.attending,
+            'not_attending': self.not_attending,
+            'pending': self.pending,
+            'plus_ones': self.plus_ones,
+            'response_rate': response_rate(self.rsvps, self.pending),
+            'refreshed_at': self.refreshed_at.isoformat()
+        }
+
+
+def response_rate(rsvps, pending):
+    '''
+      response_rate(rsvps, pending)
+          share of RSVPs with a definite answer, None when there are no RSVPs
+    '''
+    if not rsvps:
+        return None
+    return round((rsvps - pending) / rsvps, 4)
+
+
+class ArchivedInvitation(db.Model):
+    '''
+      ArchivedInvitation
+      A soft deleted invitation moved out of the invitations table by
+      `python manage.py archive`. Same columns as Invitation, plus archived_at.
+    '''
+    __tablename__ = 'invitations_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(120), nullable=False)
+    email = Column(String(120), nullable=False)
+    description = Column(String(500), nullable=False)
+    deleted_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class ArchivedRSVP(db.Model):
+    '''
+      ArchivedRSVP
+      An RSVP to an archived invitation. Same columns as RSVP, plus archived_at.
+    '''
+    __tablename__ = 'rsvps_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    jwt_sub = Column(String(120), nullable=False)
+    response = Column(String(120), nullable=False)
+    guest_name = Column(String(120), nullable=False)
+    guest_email = Column(String(120), nullable=False)
+    plus_one = Column(db.Boolean, default=False)
+    invitation_id = Column(Integer, nullable=False, index=True)
+    archived_at = Column(DateTime, nullable=False)
+
+
+def archive_invitations(deleted_before, batch_size=500):
+    '''
+      archive_invitations(deleted_before, batch_size)
+          moves up to batch_size invitations soft deleted before deleted_before,
+          and their RSVPs, to the archive tables in one transaction
+          the rows are copied and removed with set-based statements, nothing is loaded
+          returns the number of invitations archived, 0 once there are none left
+    '''
+    ids = [id for id, in db.session.query(Invitation.id)
+           .filter(Invitation.deleted_at < deleted_before)
+           .order_by(Invitation.deleted_at)
+           .limit(batch_size)]
+    if not ids:
+        return 0
+
+    now = literal(datetime.utcnow(), DateTime)
+    invitations = Invitation.__table__
+    rsvps = RSVP.__table__
+
+    db.session.execute(insert(ArchivedInvitation.__table__).from_select(
+        ['id', 'name', 'email', 'description', 'deleted_at', 'archived_at'],
+        select(invitations.c.id, invitations.c.name, invitations.c.email,
+               invitations.c.description, invitations.c.deleted_at, now)
+        .where(invitations.c.id.in_(ids))
+    ))
+    db.session.execute(insert(ArchivedRSVP.__table__).from_select(
+        ['id', 'jwt_sub', 'response', 'guest_name', 'guest_email', 'plus_one', 'invitation_id', 'archived_at'],
+        select(rsvps.c.id, rsvps.c.jwt_sub, rsvps.c.response, rsvps.c.guest_name,
+               rsvps.c.guest_email, rsvps.c.plus_one, rsvps.c.invitation_id, now)
+        .where(rsvps.c.invitation_id.in_(ids))
+    ))
+    db.session.execute(invitations.delete().where(invitations.c.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
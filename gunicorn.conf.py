@@ -0,0 +1,97 @@
+'''
+Gunicorn production settings.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app) and shared with the
+workers copy-on-write. Database connections are not shared across the fork:
+the pool is emptied in the master before each fork and every worker opens its
+own connections and fetches the JWKS in post_fork, before taking requests.
+
+Environment variables:
+    WEB_CONCURRENCY         number of worker processes
+    GUNICORN_WORKER_CLASS   sync (default), gthread or gevent
+    GUNICORN_THREADS        threads per worker, gthread only (default 2 per core);
+                            ignored by the other worker classes
+    GUNICORN_CONNECTIONS    concurrent connections per worker for gevent
+    GUNICORN_KEEPALIVE      seconds to keep idle connections open
+    PORT                    port to bind to
+'''
+import os
+import multiprocessing
+
+cpus = multiprocessing.cpu_count()
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+
+default_threads = 1
+
+if worker_class == 'gthread':
+    # requests mostly wait on the database, so each worker runs a couple of
+    # threads per core
+    default_workers = cpus + 1
+    default_threads = cpus * 2
+elif worker_class == 'gevent':
+    # one worker per core, concurrency comes from worker_connections;
+    # psycopg2 blocks the whole worker unless psycogreen makes it cooperative
+    try:
+        import psycogreen.gevent
+    except ImportError as e:
+        raise RuntimeError(f'GUNICORN_WORKER_CLASS=gevent requires gevent and psycogreen to be installed: {e}')
+    default_workers = cpus
+else:
+    default_workers = cpus * 2 + 1
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', default_workers))
+# gunicorn silently switches sync workers to gthread when threads > 1,
+# so the variable is only read when gthread was asked for
+threads = int(os.getenv('GUNICORN_THREADS', default_threads)) if worker_class == 'gthread' else 1
+worker_connections = int(os.getenv('GUNICORN_CONNECTIONS', 1000))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+preload_app = True
+max_requests = 1000
+max_requests_jitter = 100
+timeout = 30
+graceful_timeout = 30
+accesslog = '-'
+
+
+def pre_fork(server, worker):
+    '''
+      pre_fork(server, worker)
+          closes the master's pooled connections so no socket is shared with a worker
+    '''
+    from app import app
+    from database.models import db
+
+    with app.app_context():
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    '''
+      post_fork(server, worker)
+          makes psycopg2 cooperative in gevent workers, then opens the worker's
+          first database connection and fetches the JWKS, so the first requests
+          a worker serves don't pay for either
+    '''
+    from sqlalchemy import text
+    from app import app
+    from database.models import db
+    from auth.auth import get_jwks
+
+    if worker_class == 'gevent':
+        psycogreen.gevent.patch_psycopg()
+
+    with app.app_context():
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception as e:
+            server.log.warning('worker %s could not warm the database pool: %s', worker.pid, e)
+
+    try:
+        get_jwks()
+    except Exception as e:
+        server.log.warning('worker %s could not fetch the JWKS: %s', worker.pid, e)
@@ -1,8 +1,9 @@
+from datetime import datetime, timedelta
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
 from app import app
-from database.models import db
+from database.models import db, GuestListReport, archive_invitations
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -10,5 +11,32 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.command
+def refresh_reports():
+    '''
+    Rebuild the guest-list report for every invitation
+    '''
+    GuestListReport.refresh()
+    db.session.commit()
+
+
+@manager.option('-d', '--days', dest='days', type=int, default=30,
+                help='archive invitations soft deleted more than this many days ago')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500,
+                help='invitations moved per transaction')
+def archive(days, batch_size):
+    '''
+    Move old soft deleted invitations and their RSVPs to the archive tables
+    '''
+    deleted_before = datetime.utcnow() - timedelta(days=days)
+    total = 0
+    while True:
+        archived = archive_invitations(deleted_before, batch_size)
+        if not archived:
+            break
+        total += archived
+        print(f'archived {total} invitations')
+
+
 if __name__ == '__main__':
-    manager.run()
\ No newline at end of file
+    manager.run()
@@ -0,0 +1,180 @@
+'''
+Test harness for tests.py.
+
+The suite runs offline and fast:
+    - one app and one schema per process, on TEST_DATABASE_URL or in-memory SQLite
+    - every test runs inside a transaction that is rolled back when it ends,
+      the code under test commits to a savepoint instead
+    - tokens are signed with a local RS256 key and verified against a stub JWKS,
+      so no Auth0 tenant is needed
+
+Each pytest-xdist worker is its own process with its own in-memory database,
+so `pytest -n auto tests.py` needs no extra setup.
+'''
+import os
+import time
+import sqlite3
+import unittest
+import base64
+import rsa
+from jose import jwt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import scoped_session
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
+for name, value in (('DATABASE_URL', TEST_DATABASE_URL),
+                    ('AUTH0_DOMAIN', 'test.auth0.local'),
+                    ('API_AUDIENCE', 'invitations-test')):
+    if not os.environ.get(name):
+        os.environ[name] = value
+
+import auth.auth
+from app import create_app
+from database.models import db
+
+KID = 'test-key'
+
+ADMIN_PERMISSIONS = [
+    'post:invitation',
+    'patch:invitation',
+    'delete:invitation',
+    'get:invitation-rsvps',
+    'get:invitation-rsvp-details'
+]
+GUEST_PERMISSIONS = [
+    'get:invitation-rsvp-details',
+    'post:invitation-rsvp',
+    'patch:invitation-rsvp',
+    'delete:invitation-rsvp'
+]
+
+
+@event.listens_for(Engine, 'connect')
+def sqlite_manual_transactions(dbapi_connection, connection_record):
+    '''
+      sqlite_manual_transactions()
+          pysqlite opens transactions lazily, which breaks SAVEPOINT,
+          so BEGIN is emitted explicitly in sqlite_begin instead
+    '''
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.isolation_level = None
+
+
+@event.listens_for(Engine, 'begin')
+def sqlite_begin(connection):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('BEGIN')
+
+
+def _b64(number):
+    data = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+# 1024 bits keeps key generation well under a second per process; test only
+_public_key, _private_key = rsa.newkeys(1024)
+PRIVATE_KEY = _private_key.save_pkcs1().decode('ascii')
+JWKS = {
+    'keys': [{
+        'kty': 'RSA',
+        'kid': KID,
+        'use': 'sig',
+        'alg': 'RS256',
+        'n': _b64(_public_key.n),
+        'e': _b64(_public_key.e)
+    }]
+}
+
+
+def mint_token(sub, permissions, expires_in=3600, **claims):
+    '''
+      mint_token(sub, permissions, expires_in, **claims)
+          returns an RS256 token signed with the local key,
+          with the issuer and audience requires_auth expects
+    '''
+    now = int(time.time())
+    payload = {
+        'iss': f'https://{auth.auth.AUTH0_DOMAIN}/',
+        'aud': auth.auth.API_AUDIENCE,
+        'sub': sub,
+        'permissions': permissions,
+        'iat': now,
+        'exp': now + expires_in
+    }
+    payload.update(claims)
+    return jwt.encode(payload, PRIVATE_KEY, algorithm='RS256', headers={'kid': KID})
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+_app = None
+
+
+def get_app():
+    '''
+      get_app()
+          the app shared by every test in this process, created with a fresh schema
+          and the JWKS stubbed out
+    '''
+    global _app
+    if _app is None:
+        auth.auth.get_jwks = lambda refresh=False: JWKS
+        _app = create_app({
+            'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL,
+            'QUERY_BUDGET_RAISE': True
+        })
+        with _app.app_context():
+            db.drop_all()
+            db.create_all()
+    return _app
+
+
+class TestSession(scoped_session):
+    '''
+      TestSession
+          a scoped session that stays open when a request ends,
+          so objects a test holds are still attached after it calls the API
+    '''
+    def remove(self):
+        pass
+
+    def close(self):
+        super().remove()
+
+
+class TransactionalTestCase(unittest.TestCase):
+    '''
+      TransactionalTestCase
+          runs each test in a transaction on one connection and rolls it back afterwards
+          db.session is bound to that connection, and each commit releases a savepoint
+          that is reopened straight away, so nothing outlives the test
+          changes a test makes to app.config are undone as well
+    '''
+
+    def setUp(self):
+        self.app = get_app()
+        self.client = self.app.test_client
+        self.config = dict(self.app.config)
+
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.nested = self.connection.begin_nested()
+
+        self.session = db.session
+        db.session = TestSession(db.create_session({'bind': self.connection, 'binds': {}}))
+        event.listen(db.session(), 'after_transaction_end', self.restart_savepoint)
+
+    def restart_savepoint(self, session, transaction):
+        if not self.nested.is_active:
+            self.nested = self.connection.begin_nested()
+
+    def tearDown(self):
+        db.session.close()
+        db.session = self.session
+        self.transaction.rollback()
+        self.connection.close()
+        self.app.config.clear()
+        self.app.config.update(self.config)
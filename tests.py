@@ -1,39 +1,29 @@
 import unittest
-from app import create_app
-from database.models import Invitation, RSVP, setup_db, db
-from flask_sqlalchemy import SQLAlchemy
-from dotenv import load_dotenv
-import os
+import gzip
+import json
+from datetime import datetime, timedelta
+from flask import jsonify
+from testing import TransactionalTestCase, mint_token, bearer, ADMIN_PERMISSIONS, GUEST_PERMISSIONS
+from database.models import Invitation, RSVP, GuestListReport, ArchivedInvitation, ArchivedRSVP, archive_invitations, db
+from database.instrumentation import QueryBudgetExceeded
 
-load_dotenv()
 
-class FlaskAPITestCase(unittest.TestCase):
+class FlaskAPITestCase(TransactionalTestCase):
 
     def setUp(self):
         """Setup method for each test case"""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_path = os.environ.get('TEST_DATABASE_URL')
-        setup_db(self.app, self.database_path)
-
-        self.guest_auth = {'Authorization': f"Bearer {os.environ.get('GUEST_JWT')}"}
-        self.admin_auth = {'Authorization': f"Bearer {os.environ.get('ADMIN_JWT')}"}
-        self.guest_jwt_sub = os.environ.get('GUEST_JWT_SUB')
-        self.invitation = Invitation(name='John Doe', email='johndoe@example.com', description='Please come to my birthday party!')
-        self.rsvp = RSVP(invitation_id=1, response='Attending', guest_name='Jane Doe', guest_email='janedoe@example.com', plus_one=True, jwt_sub=self.guest_jwt_sub)
+        super().setUp()
 
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            self.db.drop_all()
-            self.db.create_all()
+        self.guest_jwt_sub = 'auth0|guest'
+        self.guest_auth = bearer(mint_token(self.guest_jwt_sub, GUEST_PERMISSIONS))
+        self.admin_auth = bearer(mint_token('auth0|admin', ADMIN_PERMISSIONS))
+        self.invitation = Invitation(name='John Doe', email='johndoe@example.com', description='Please come to my birthday party!')
+        self.rsvp = RSVP(invitation_id=None, response='Attending', guest_name='Jane Doe', guest_email='janedoe@example.com', plus_one=True, jwt_sub=self.guest_jwt_sub)
 
-    def tearDown(self):
-        """Teardown method for each test case"""
-        with self.app.app_context():
-            db.session.remove()
-            db.drop_all()
-        pass
+    def insert_rsvp(self):
+        """Insert self.rsvp as a response to self.invitation"""
+        self.rsvp.invitation_id = self.invitation.id
+        self.rsvp.insert()
 
     def test_create_invitation(self):
         """Test creating a new invitation"""
@@ -63,6 +53,11 @@ class FlaskAPITestCase(unittest.TestCase):
         response = self.client().post('/invitations', headers=self.guest_auth)
         self.assertEqual(response.status_code, 403)
 
+    def test_expired_token(self):
+        response = self.client().get('/reports/guest-list',
+                                     headers=bearer(mint_token('auth0|admin', ADMIN_PERMISSIONS, expires_in=-60)))
+        self.assertEqual(response.status_code, 401)
+
     def test_get_invitation_rsvps_missing_auth(self):
         response = self.client().get('/invitations/1/rsvps')
         self.assertEqual(response.status_code, 401)
@@ -82,6 +77,58 @@ class FlaskAPITestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.json.get('success'), True)
 
+    def test_retrieve_invitations_compact(self):
+        """Test retrieving all invitations in the columnar shape"""
+        self.invitation.insert()
+
+        response = self.client().get('/invitations?format=compact')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['invitations']['columns'], list(Invitation.format_columns))
+        self.assertEqual(response.json['invitations']['rows'][0][1], self.invitation.name)
+
+    def test_retrieve_invitations_matches_jsonify(self):
+        """Test list responses are serialized with the app's JSON encoder and settings"""
+        self.invitation.insert()
+
+        response = self.client().get('/invitations')
+        self.assertEqual(response.status_code, 200)
+        with self.app.test_request_context():
+            expected = jsonify(success=True, invitations=[self.invitation.format()]).get_data()
+        self.assertEqual(response.get_data(), expected)
+
+    def test_retrieve_invitations_gzip(self):
+        """Test large list responses are gzip compressed when accepted"""
+        self.invitation.insert()
+        self.app.config['COMPRESS_MIN_SIZE'] = 0
+
+        response = self.client().get('/invitations', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        body = json.loads(gzip.decompress(response.data))
+        self.assertEqual(body['invitations'][0]['name'], self.invitation.name)
+
+    def test_query_budget_exceeded(self):
+        """Test a route that runs more queries than its budget fails"""
+        self.app.testing = True
+        self.app.config['QUERY_BUDGETS'] = {'get_invitations': {'queries': 0}}
+
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client().get('/invitations')
+
+    def test_slow_query_log(self):
+        """Test statements over SLOW_QUERY_MS are logged with their plan"""
+        self.invitation.insert()
+        self.app.config['SLOW_QUERY_MS'] = 0
+
+        with self.assertLogs('database.instrumentation', level='WARNING') as logs:
+            response = self.client().get(f'/invitations/{self.invitation.id}')
+        self.assertEqual(response.status_code, 200)
+        entries = [json.loads(line.split('slow query ', 1)[1]) for line in logs.output if 'slow query ' in line]
+        self.assertTrue(entries)
+        self.assertEqual(entries[0]['endpoint'], 'get_invitation')
+        self.assertIn('plan', entries[0])
+        self.assertTrue(entries[0]['plan'])
+
     def test_retrieve_invitation_by_id(self):
         """Test retrieving a single invitation by ID"""
         self.invitation.insert()
@@ -109,8 +156,44 @@ class FlaskAPITestCase(unittest.TestCase):
         
         response = self.client().delete(f'/invitations/{self.invitation.id}', headers=self.admin_auth)
         self.assertEqual(response.status_code, 200)
-        invitation = Invitation.query.filter_by(email=self.invitation.email).first()
+        invitation = Invitation.live().filter_by(email=self.invitation.email).first()
         self.assertIsNone(invitation)
+        invitation = Invitation.query.filter_by(email=self.invitation.email).first()
+        self.assertIsNotNone(invitation.deleted_at)
+
+    def test_get_deleted_invitation(self):
+        """Test a soft deleted invitation is no longer returned"""
+        self.invitation.insert()
+        self.invitation.delete()
+
+        response = self.client().get(f'/invitations/{self.invitation.id}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_hard_delete_invitation_cascades(self):
+        """Test hard deleting an invitation removes its RSVPs in the database"""
+        self.invitation.insert()
+        self.insert_rsvp()
+        rsvp_id = self.rsvp.id
+        # with the collection loaded the ORM must still leave the RSVPs to the database
+        self.assertEqual(len(self.invitation.rsvps), 1)
+
+        self.invitation.hard_delete()
+        self.assertIsNone(RSVP.query.filter_by(id=rsvp_id).first())
+
+    def test_archive_invitations(self):
+        """Test soft deleted invitations are moved to the archive tables with their RSVPs"""
+        self.invitation.insert()
+        self.insert_rsvp()
+        self.invitation.delete()
+        invitation_id, rsvp_id = self.invitation.id, self.rsvp.id
+
+        archived = archive_invitations(datetime.utcnow() + timedelta(days=1))
+        self.assertEqual(archived, 1)
+        self.assertIsNone(Invitation.query.filter_by(id=invitation_id).first())
+        self.assertIsNone(RSVP.query.filter_by(id=rsvp_id).first())
+        self.assertEqual(ArchivedInvitation.query.filter_by(id=invitation_id).count(), 1)
+        self.assertEqual(ArchivedRSVP.query.filter_by(id=rsvp_id).count(), 1)
+        self.assertEqual(archive_invitations(datetime.utcnow() + timedelta(days=1)), 0)
 
 
 
@@ -132,7 +215,7 @@ class FlaskAPITestCase(unittest.TestCase):
     def test_retrieve_rsvp_by_id(self):
         """Test retrieving a single RSVP by ID"""
         self.invitation.insert()
-        self.rsvp.insert()
+        self.insert_rsvp()
         
         response = self.client().get(f'/invitations/{self.invitation.id}/rsvps/{self.rsvp.id}', headers=self.guest_auth)
         self.assertEqual(response.status_code, 200)
@@ -141,13 +224,13 @@ class FlaskAPITestCase(unittest.TestCase):
     def test_get_rsvp_not_found(self):
         self.invitation.insert()
         
-        response = self.client().get('/invitations/1/rsvps/999', headers=self.guest_auth)
+        response = self.client().get(f'/invitations/{self.invitation.id}/rsvps/999', headers=self.guest_auth)
         self.assertEqual(response.status_code, 404)
 
     def test_update_rsvp(self):
         """Test updating an existing RSVP by ID"""
         self.invitation.insert()
-        self.rsvp.insert()
+        self.insert_rsvp()
         
         updated_response = 'Not Attending'
         response = self.client().patch(f'/invitations/{self.invitation.id}/rsvps/{self.rsvp.id}', json={
@@ -160,12 +243,88 @@ class FlaskAPITestCase(unittest.TestCase):
     def test_delete_rsvp(self):
         """Test deleting an existing RSVP by ID"""
         self.invitation.insert()
-        self.rsvp.insert()
+        self.insert_rsvp()
 
         response = self.client().delete(f'/invitations/{self.invitation.id}/rsvps/{self.rsvp.id}', headers=self.guest_auth)
         self.assertEqual(response.status_code, 200)
         rsvp = RSVP.query.filter_by(guest_email=self.rsvp.guest_email).first()
         self.assertIsNone(rsvp)
 
+    def test_guest_list_report(self):
+        """Test the guest-list report reflects RSVP writes"""
+        self.invitation.insert()
+        self.insert_rsvp()
+
+        response = self.client().get('/reports/guest-list', headers=self.admin_auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['totals']['rsvps'], 1)
+        self.assertEqual(response.json['totals']['attending'], 1)
+        self.assertEqual(response.json['totals']['plus_ones'], 1)
+        self.assertEqual(response.json['invitations'][0]['invitation_id'], self.invitation.id)
+
+    def test_guest_list_report_refresh(self):
+        """Test a full refresh matches the incrementally maintained report"""
+        self.invitation.insert()
+        self.insert_rsvp()
+        second = RSVP(invitation_id=self.invitation.id, response='Undecided', guest_name='Tom Jones', guest_email='tom@example.com', plus_one=True, jwt_sub=self.guest_jwt_sub)
+        second.insert()
+        self.client().patch(f'/invitations/{self.invitation.id}/rsvps/{self.rsvp.id}', json={'response': 'Not Attending'}, headers=self.guest_auth)
+        self.client().patch(f'/invitations/{self.invitation.id}/rsvps/{second.id}', json={'response': 'Attending'}, headers=self.guest_auth)
+        self.client().delete(f'/invitations/{self.invitation.id}/rsvps/{self.rsvp.id}', headers=self.guest_auth)
+        before = [r.format() for r in GuestListReport.query.all()]
+        self.assertEqual(before[0]['rsvps'], 1)
+        self.assertEqual(before[0]['plus_ones'], 1)
+
+        GuestListReport.refresh()
+        db.session.commit()
+        after = [r.format() for r in GuestListReport.query.all()]
+        for row in before + after:
+            row.pop('refreshed_at')
+        self.assertEqual(before, after)
+
+    def test_guest_list_report_keeps_concurrent_writes(self):
+        """Test an RSVP write adds to the report instead of overwriting another writer's counts"""
+        self.invitation.insert()
+        # another worker's RSVP, counted in the report but not yet visible in the rsvps table
+        db.session.execute(GuestListReport.__table__.update()
+                           .where(GuestListReport.invitation_id == self.invitation.id)
+                           .values(rsvps=GuestListReport.rsvps + 1, pending=GuestListReport.pending + 1))
+        db.session.commit()
+
+        self.insert_rsvp()
+        report = GuestListReport.query.get(self.invitation.id)
+        self.assertEqual(report.rsvps, 2)
+        self.assertEqual(report.pending, 1)
+        self.assertEqual(report.attending, 1)
+
+    def test_guest_list_report_missing_row(self):
+        """Test an RSVP to an invitation without a report row rebuilds the row"""
+        self.invitation.insert()
+        GuestListReport.query.filter_by(invitation_id=self.invitation.id).delete()
+        db.session.commit()
+
+        response = self.client().post(f'/invitations/{self.invitation.id}/rsvps', json={
+            'response': self.rsvp.response,
+            'guest_name': self.rsvp.guest_name,
+            'guest_email': self.rsvp.guest_email,
+            'plus_one': self.rsvp.plus_one
+        }, headers=self.guest_auth)
+        self.assertEqual(response.status_code, 200)
+        report = GuestListReport.query.get(self.invitation.id)
+        self.assertEqual(report.rsvps, 1)
+        self.assertEqual(report.attending, 1)
+        self.assertEqual(report.plus_ones, 1)
+
+    def test_retrieve_rsvps_compact(self):
+        """Test the columnar RSVP list hoists invitation_id out of the rows"""
+        self.invitation.insert()
+        self.insert_rsvp()
+
+        response = self.client().get(f'/invitations/{self.invitation.id}/rsvps?format=compact', headers=self.admin_auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['invitation_id'], self.invitation.id)
+        self.assertNotIn('invitation_id', response.json['rsvps']['columns'])
+        self.assertEqual(len(response.json['rsvps']['rows']), 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
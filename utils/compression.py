@@ -0,0 +1,116 @@
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+COMPRESS_MIMETYPES = ('application/json',)
+
+
+class _GzipCompressor:
+    '''
+      _GzipCompressor
+          incremental gzip compressor with the same interface as brotli.Compressor
+    '''
+    def __init__(self, level:int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data:bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encodings():
+    '''
+      available_encodings()
+          content codings this server can produce, most preferred first
+          brotli is only offered when the optional brotli package is installed
+    '''
+    if brotli is not None:
+        return ['br', 'gzip']
+    return ['gzip']
+
+
+def negotiate_encoding():
+    '''
+      negotiate_encoding()
+          picks the best content coding from the request Accept-Encoding header
+          returns None when the client accepts none of the available encodings
+    '''
+    return request.accept_encodings.best_match(available_encodings())
+
+
+def get_compressor(encoding:str, level:int=COMPRESS_LEVEL):
+    '''
+      get_compressor(encoding, level)
+          returns an incremental compressor exposing process() and finish()
+    '''
+    if encoding == 'br':
+        return brotli.Compressor(quality=min(level, 11))
+    return _GzipCompressor(level)
+
+
+def compress_chunks(chunks, encoding:str, level:int=COMPRESS_LEVEL):
+    '''
+      compress_chunks(chunks, encoding, level)
+          compresses an iterable of bytes one chunk at a time
+          only non-empty compressed blocks are yielded
+    '''
+    compressor = get_compressor(encoding, level)
+    for chunk in chunks:
+        block = compressor.process(chunk)
+        if block:
+            yield block
+    block = compressor.finish()
+    if block:
+        yield block
+
+
+def should_compress(response, min_size:int) -> bool:
+    '''
+      should_compress(response, min_size)
+          True for buffered, not yet encoded responses of a compressible type
+          whose body is at least min_size bytes
+    '''
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return False
+    return response.calculate_content_length() >= min_size
+
+
+def init_compression(app):
+    '''
+      init_compression(app)
+          registers an after_request hook that compresses buffered JSON responses
+          COMPRESS_MIN_SIZE and COMPRESS_LEVEL can be set in the app config
+    '''
+    app.config.setdefault('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE)
+    app.config.setdefault('COMPRESS_LEVEL', COMPRESS_LEVEL)
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if not should_compress(response, app.config['COMPRESS_MIN_SIZE']):
+            return response
+
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return response
+
+        body = b''.join(compress_chunks([response.get_data()], encoding, app.config['COMPRESS_LEVEL']))
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    return app
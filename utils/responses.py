@@ -0,0 +1,99 @@
+from flask import current_app, request
+
+from utils.compression import negotiate_encoding, compress_chunks
+
+COMPACT_FORMAT = 'compact'
+
+
+def wants_compact():
+    '''
+      wants_compact()
+          True when the client opted in to the columnar shape with ?format=compact
+    '''
+    return request.args.get('format') == COMPACT_FORMAT
+
+
+def columnar(rows, columns, hoist=()):
+    '''
+      columnar(rows, columns, hoist)
+          converts a list of format() dicts into {columns: [...], rows: [[...]]}
+          keys in hoist are shared by every row, so they are left out of the columns
+    '''
+    columns = [c for c in columns if c not in hoist]
+    return {
+        'columns': columns,
+        'rows': [[row[c] for c in columns] for row in rows]
+    }
+
+
+def json_encoder():
+    '''
+      json_encoder()
+          the app's JSON encoder with its JSON_SORT_KEYS and JSON_AS_ASCII settings,
+          and compact separators, so list output matches jsonify without the whitespace
+    '''
+    return current_app.json_encoder(
+        separators=(',', ':'),
+        sort_keys=current_app.config['JSON_SORT_KEYS'],
+        ensure_ascii=current_app.config['JSON_AS_ASCII']
+    )
+
+
+def _iter_json(payload, encoder):
+    buffer = []
+    size = 0
+    for piece in encoder.iterencode(payload):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= 8192:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    buffer.append('\n')
+    yield ''.join(buffer).encode('utf-8')
+
+
+def _peek(chunks, min_size:int):
+    head = []
+    size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= min_size:
+            return head, True
+    return head, False
+
+
+def _chain(head, chunks):
+    yield from head
+    yield from chunks
+
+
+def list_response(key:str, items, columns, **extra):
+    '''
+      list_response(key, items, columns, **extra)
+          builds the JSON response for a list endpoint
+          items are format() dicts, columns is the model's format_columns
+          with ?format=compact the list is returned in the columnar shape and
+          the keys given in extra are hoisted out of every row
+          bodies over COMPRESS_MIN_SIZE are compressed while they are serialized,
+          so a large list is never held both encoded and compressed in memory
+    '''
+    if wants_compact():
+        payload = {'success': True, **extra, key: columnar(items, columns, hoist=extra)}
+    else:
+        payload = {'success': True, key: items}
+
+    response = current_app.response_class(mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    chunks = _iter_json(payload, json_encoder())
+    head, large = _peek(chunks, current_app.config['COMPRESS_MIN_SIZE'])
+    encoding = negotiate_encoding() if large else None
+
+    if encoding is None:
+        response.set_data(b''.join(_chain(head, chunks)))
+        return response
+
+    response.response = compress_chunks(_chain(head, chunks), encoding, current_app.config['COMPRESS_LEVEL'])
+    response.headers['Content-Encoding'] = encoding
+    return response